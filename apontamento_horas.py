@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 
 import csv
+import io
 import os
 import re
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 # Valor-hora configurável (R$ por hora trabalhada)
 VALOR_HORA_PADRAO = 113.63  # usado como sugestão ao criar novos projetos
@@ -20,25 +22,28 @@ FIELDNAMES = [
     "valor",
     "pago",
 ]
+_FIELDNAMES_TUPLE = tuple(FIELDNAMES)
+_FIELDSET = frozenset(FIELDNAMES)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+TAMANHO_BUFFER_ESCRITA = 1 << 20
+
+SLUG_INVALIDO_REGEX = re.compile(r"[^\w\-]+")
+UNDERSCORES_REGEX = re.compile(r"_+")
+
 
 def listar_projetos() -> list[str]:
-    projetos = []
-    for nome in os.listdir(BASE_DIR):
-        caminho = os.path.join(BASE_DIR, nome)
-        if os.path.isfile(caminho) and nome.lower().endswith(".csv"):
-            projetos.append(nome)
-    return sorted(projetos)
+    with os.scandir(BASE_DIR) as entradas:
+        return sorted(e.name for e in entradas if e.is_file() and e.name.lower().endswith(".csv"))
 
 
 def normalizar_nome_projeto(nome: str) -> str | None:
     nome = nome.strip().lower()
     if not nome:
         return None
-    slug = re.sub(r"[^\w\-]+", "_", nome)
-    slug = re.sub(r"_+", "_", slug).strip("_")
+    slug = SLUG_INVALIDO_REGEX.sub("_", nome)
+    slug = UNDERSCORES_REGEX.sub("_", slug).strip("_")
     if not slug:
         return None
     if not slug.endswith(".csv"):
@@ -77,20 +82,21 @@ def solicitar_valor_hora(valor_sugerido: float | None = None) -> float:
 def ler_valor_hora_no_arquivo(filename: str) -> float | None:
     if not os.path.isfile(filename):
         return None
-
     with open(filename, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        if not reader.fieldnames:
+        reader = csv.reader(csvfile)
+        cabecalho = next(reader, None)
+        if not cabecalho:
             return None
-        if "valor_hora" not in reader.fieldnames:
+        try:
+            idx = cabecalho.index("valor_hora")
+        except ValueError:
             return None
-
         for row in reader:
-            bruto = row.get("valor_hora")
+            bruto = row[idx] if len(row) > idx else ""
             if not bruto:
                 continue
             try:
-                return float(str(bruto).replace(",", "."))
+                return float(bruto.replace(",", "."))
             except ValueError:
                 continue
     return None
@@ -101,38 +107,42 @@ def sincronizar_layout_csv(filename: str, valor_hora_padrao: float | None = None
         return
 
     with open(filename, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        registros = list(reader)
-        cabecalho = reader.fieldnames or []
-
-    precisa_coluna = "valor_hora" not in cabecalho or cabecalho != FIELDNAMES
-    precisa_completar = any(
-        not str(reg.get("valor_hora", "")).strip() for reg in registros
-    )
-
-    if not precisa_coluna and not (precisa_completar and valor_hora_padrao is not None):
-        return
-
-    with open(filename, "w", newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile)
+        cabecalho = next(reader, None) or []
+        if tuple(cabecalho) == _FIELDNAMES_TUPLE:
+            # layout em dia: só reescreve se houver valor_hora vazio para completar
+            if valor_hora_padrao is None:
+                return
+            idx = cabecalho.index("valor_hora")
+            if not any(len(row) > idx and not row[idx].strip() for row in reader):
+                return
+
+        csvfile.seek(0)
+        registros = list(csv.DictReader(csvfile))
+
+    saida = []
+    for row in registros:
+        valor_atual = str(row.get("valor_hora", "") or "").strip()
+        if not valor_atual and valor_hora_padrao is not None:
+            valor_atual = f"{valor_hora_padrao:.2f}"
+
+        saida.append(
+            {
+                "n": row.get("n", ""),
+                "tempo_total": row.get("tempo_total", ""),
+                "atividade": row.get("atividade", ""),
+                "data_inicio": row.get("data_inicio", ""),
+                "data_fim": row.get("data_fim", ""),
+                "valor_hora": valor_atual,
+                "valor": row.get("valor", ""),
+                "pago": row.get("pago", ""),
+            }
+        )
+
+    with open(filename, "w", newline="", encoding="utf-8", buffering=TAMANHO_BUFFER_ESCRITA) as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
         writer.writeheader()
-        for row in registros:
-            valor_atual = str(row.get("valor_hora", "") or "").strip()
-            if not valor_atual and valor_hora_padrao is not None:
-                valor_atual = f"{valor_hora_padrao:.2f}"
-
-            writer.writerow(
-                {
-                    "n": row.get("n", ""),
-                    "tempo_total": row.get("tempo_total", ""),
-                    "atividade": row.get("atividade", ""),
-                    "data_inicio": row.get("data_inicio", ""),
-                    "data_fim": row.get("data_fim", ""),
-                    "valor_hora": valor_atual,
-                    "valor": row.get("valor", ""),
-                    "pago": row.get("pago", ""),
-                }
-            )
+        writer.writerows(saida)
 
 
 def obter_valor_hora_projeto(filename: str) -> float:
@@ -175,66 +185,64 @@ def criar_novo_projeto() -> tuple[str, float]:
 
 
 def selecionar_ou_criar_projeto() -> tuple[str, float]:
+    # lista uma vez só: entradas inválidas não mudam o diretório
+    projetos = listar_projetos()
+    if not projetos:
+        print("\nNenhum projeto encontrado. Vamos criar o primeiro agora.")
+        return criar_novo_projeto()
+
     while True:
-        projetos = listar_projetos()
-        if projetos:
-            print("\n=== Projetos disponíveis ===")
-            for idx, nome in enumerate(projetos, start=1):
-                print(f"{idx}. {nome}")
-            print(f"{len(projetos) + 1}. Criar novo projeto")
-
-            escolha = input("Selecione uma opção: ").strip()
-            if not escolha.isdigit():
-                print("Informe o número da opção.")
-                continue
+        print("\n=== Projetos disponíveis ===")
+        for idx, nome in enumerate(projetos, start=1):
+            print(f"{idx}. {nome}")
+        print(f"{len(projetos) + 1}. Criar novo projeto")
+
+        escolha = input("Selecione uma opção: ").strip()
+        if not escolha.isdigit():
+            print("Informe o número da opção.")
+            continue
 
-            indice = int(escolha)
-            if 1 <= indice <= len(projetos):
-                arquivo = projetos[indice - 1]
-                caminho = os.path.join(BASE_DIR, arquivo)
-                print(f"\nProjeto selecionado: {arquivo}")
-                valor_hora = obter_valor_hora_projeto(caminho)
-                return caminho, valor_hora
-            if indice == len(projetos) + 1:
-                return criar_novo_projeto()
-
-            print("Opção inválida. Tente novamente.")
-        else:
-            print("\nNenhum projeto encontrado. Vamos criar o primeiro agora.")
+        indice = int(escolha)
+        if 1 <= indice <= len(projetos):
+            arquivo = projetos[indice - 1]
+            caminho = os.path.join(BASE_DIR, arquivo)
+            print(f"\nProjeto selecionado: {arquivo}")
+            valor_hora = obter_valor_hora_projeto(caminho)
+            return caminho, valor_hora
+        if indice == len(projetos) + 1:
             return criar_novo_projeto()
 
-COMPONENTE_TEMPO_REGEX = re.compile(r"(\d+(?:[.,]\d+)?)([hm])", re.IGNORECASE)
+        print("Opção inválida. Tente novamente.")
+
+TEMPO_REGEX = re.compile(r"(?:(\d+(?:[.,]\d+)?)h)?(?:(\d+(?:[.,]\d+)?)m)?", re.IGNORECASE)
 
 
 def converter_para_minutos(valor: str | None) -> int | None:
     if not valor:
         return None
+    return _converter_para_minutos(valor)
 
-    compactado = valor.strip().lower().replace(" ", "")
-    posicao = 0
-    total_minutos = 0.0
 
-    for match in COMPONENTE_TEMPO_REGEX.finditer(compactado):
-        if match.start() != posicao:
-            return None  # caractere inesperado entre componentes
-
-        numero_bruto, unidade = match.groups()
-        numero_normalizado = numero_bruto.replace(",", ".")
-
-        try:
-            quantidade = float(numero_normalizado)
-        except ValueError:
-            return None
-
-        if unidade.lower() == "h":
-            total_minutos += quantidade * 60
-        else:
-            total_minutos += quantidade
+# durações se repetem muito no CSV ("30m", "1h", ...): memoiza por texto bruto
+@lru_cache(maxsize=4096)
+def _converter_para_minutos(valor: str) -> int | None:
+    compactado = valor.strip().lower().replace(" ", "")
+    if not compactado:
+        return None
 
-        posicao = match.end()
+    match = TEMPO_REGEX.fullmatch(compactado)
+    if not match:
+        return None  # formato esperado: [<n>h][<n>m]
 
-    if posicao != len(compactado):
-        return None  # sobrou caractere não reconhecido
+    horas_bruto, minutos_bruto = match.groups()
+    try:
+        total_minutos = 0.0
+        if horas_bruto:
+            total_minutos += float(horas_bruto.replace(",", ".")) * 60
+        if minutos_bruto:
+            total_minutos += float(minutos_bruto.replace(",", "."))
+    except ValueError:
+        return None
 
     minutos_inteiros = int(round(total_minutos))
     return minutos_inteiros if minutos_inteiros > 0 else None
@@ -252,9 +260,12 @@ def formatar_tempo(minutos: int) -> str:
     return "".join(partes)
 
 
+# troca "," <-> "." numa passada só: 1,234.56 -> 1.234,56
+_TT_REAIS = str.maketrans(",.", ".,")
+
+
 def formatar_reais(valor: float) -> str:
-    texto = f"{valor:,.2f}"
-    texto = texto.replace(",", "_").replace(".", ",").replace("_", ".")
+    texto = f"{valor:,.2f}".translate(_TT_REAIS)
     return f"R$ {texto}"
 
 
@@ -279,24 +290,60 @@ def solicitar_tempo():
 
         return formatar_tempo(minutos), minutos
 
+TAMANHO_LEITURA_CAUDA = 4096
+
+
+def _ler_ultimo_id(arquivo_binario) -> int | None:
+    # lê só o final do arquivo em vez de percorrer todas as linhas
+    arquivo_binario.seek(0, os.SEEK_END)
+    tamanho = arquivo_binario.tell()
+    inicio = max(0, tamanho - TAMANHO_LEITURA_CAUDA)
+    arquivo_binario.seek(inicio)
+    linhas = arquivo_binario.read().split(b"\n")
+    if inicio > 0:
+        # o bloco começa no meio de um registro: descarta o pedaço incompleto
+        linhas = linhas[1:]
+
+    for linha in reversed(linhas):
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            campos = next(csv.reader([linha.decode("utf-8")]))
+            return int(campos[0])
+        except (UnicodeDecodeError, StopIteration, IndexError, ValueError):
+            return None
+    return None
+
+
+def _varrer_maior_id(filename: str) -> int:
+    ultimo = 0
+    for col, row in _iter_rows_indexed(filename):
+        try:
+            ultimo = max(ultimo, int(row[col["n"]]))
+        except ValueError:
+            continue
+    return ultimo
+
+
 def proximo_id(filename: str) -> int:
     if not os.path.isfile(filename):
         return 1
 
     try:
-        with open(filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            ultimo = 0
-            for row in reader:
-                try:
-                    ultimo = max(ultimo, int(row.get("n", 0)))
-                except (TypeError, ValueError):
-                    continue
-            return ultimo + 1
+        with open(filename, "rb") as arquivo:
+            return _proximo_id_no_arquivo(arquivo, filename)
     except FileNotFoundError:
         return 1
 
 
+def _proximo_id_no_arquivo(arquivo_binario, filename: str) -> int:
+    ultimo = _ler_ultimo_id(arquivo_binario)
+    if ultimo is None:
+        ultimo = _varrer_maior_id(filename)
+    return ultimo + 1
+
+
 def imprimir_resumo(registro: dict, titulo: str = "Registro salvo", mostrar_pago: bool = True):
     print(f"\n{titulo}:")
     print("-" * 40)
@@ -311,29 +358,53 @@ def imprimir_resumo(registro: dict, titulo: str = "Registro salvo", mostrar_pago
     print("-" * 40)
 
 
-def calcular_totais_nao_pagos(filename: str) -> tuple[int, float]:
+def _iter_rows_indexed(filename: str):
+    """Percorre o CSV com csv.reader, devolvendo (col, row) com col = nome -> índice."""
     if not os.path.isfile(filename):
-        return 0, 0.0
+        return
+    with open(filename, newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile)
+        cabecalho = next(reader, None)
+        if not cabecalho:
+            return
+        col = {nome: i for i, nome in enumerate(cabecalho)}
+        largura = len(cabecalho)
+        faltando = _FIELDSET.difference(col)
+        if faltando:
+            # colunas ausentes apontam para uma célula vazia extra no fim da linha
+            for nome in faltando:
+                col[nome] = largura
+            largura += 1
+        for row in reader:
+            if not row:
+                continue  # linha em branco (DictReader também ignorava)
+            if len(row) < largura:
+                row.extend([""] * (largura - len(row)))
+            yield col, row
+
 
+def calcular_totais_nao_pagos(filename: str) -> tuple[int, float]:
     total_minutos = 0
     total_valor = 0.0
+    pagos: dict[str, bool] = {}
+
+    for col, row in _iter_rows_indexed(filename):
+        pago_bruto = row[col["pago"]]
+        pago = pagos.get(pago_bruto)
+        if pago is None:
+            pago = pagos[pago_bruto] = pago_bruto.strip().lower() == "sim"
+        if pago:
+            continue
 
-    with open(filename, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if str(row.get("pago", "")).strip().lower() == "sim":
-                continue
-
-            tempo = row.get("tempo_total")
-            minutos = converter_para_minutos(tempo)
-            if minutos:
-                total_minutos += minutos
+        minutos = converter_para_minutos(row[col["tempo_total"]])
+        if minutos:
+            total_minutos += minutos
 
-            try:
-                valor = float(str(row.get("valor", "0")).replace(",", "."))
-            except ValueError:
-                valor = 0.0
-            total_valor += valor
+        try:
+            valor = float(row[col["valor"]].replace(",", "."))
+        except ValueError:
+            valor = 0.0
+        total_valor += valor
 
     return total_minutos, total_valor
 
@@ -372,6 +443,7 @@ def add_to_csv(filename: str | None = None, valor_hora: float | None = None):
     fim = datetime.now()
     inicio = fim - timedelta(minutes=minutos)
     valor_calculado = (minutos / 60) * valor_hora
+
     registro = {
         "n": str(proximo_id(filename)),
         "tempo_total": tempo_label,
@@ -385,13 +457,19 @@ def add_to_csv(filename: str | None = None, valor_hora: float | None = None):
     if not confirmar_registro(registro):
         print("Operação cancelada. Nenhum dado foi salvo.")
         return
-    file_exists = os.path.isfile(filename)
 
-    with open(filename, "a", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(registro)
+    # abre só depois da confirmação (não cria arquivo ao cancelar nem segura o handle
+    # durante o input); um único open descobre o próximo id pela cauda e grava no fim
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+    arquivo_vazio = os.fstat(fd).st_size == 0
+    with os.fdopen(fd, "a+b") as arquivo:
+        # o arquivo pode ter mudado durante a confirmação: recalcula o id
+        registro["n"] = "1" if arquivo_vazio else str(_proximo_id_no_arquivo(arquivo, filename))
+        with io.TextIOWrapper(arquivo, encoding="utf-8", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            if arquivo_vazio:
+                writer.writeheader()
+            writer.writerow(registro)
 
     print(f"\n✅ Apontamento salvo em {nome_projeto}")
     mostrar_totais_nao_pagos(filename)
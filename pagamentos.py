@@ -21,25 +21,29 @@ FIELDNAMES = [
     "data_pagamento",
     "descricao_pagamento",
 ]
+_FIELDNAMES_TUPLE = tuple(FIELDNAMES)
+_FIELDSET = frozenset(FIELDNAMES)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+TAMANHO_BUFFER_ESCRITA = 1 << 20
+
+SLUG_INVALIDO_REGEX = re.compile(r"[^\w\-]+")
+UNDERSCORES_REGEX = re.compile(r"_+")
+DATA_PAGAMENTO_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}(?::\d{2})?)?")
+
 
 def listar_projetos() -> list[str]:
-    projetos = []
-    for nome in os.listdir(BASE_DIR):
-        caminho = os.path.join(BASE_DIR, nome)
-        if os.path.isfile(caminho) and nome.lower().endswith(".csv"):
-            projetos.append(nome)
-    return sorted(projetos)
+    with os.scandir(BASE_DIR) as entradas:
+        return sorted(e.name for e in entradas if e.is_file() and e.name.lower().endswith(".csv"))
 
 
 def normalizar_nome_projeto(nome: str) -> str | None:
     nome = nome.strip().lower()
     if not nome:
         return None
-    slug = re.sub(r"[^\w\-]+", "_", nome)
-    slug = re.sub(r"_+", "_", slug).strip("_")
+    slug = SLUG_INVALIDO_REGEX.sub("_", nome)
+    slug = UNDERSCORES_REGEX.sub("_", slug).strip("_")
     if not slug:
         return None
     if not slug.endswith(".csv"):
@@ -67,17 +71,26 @@ def solicitar_valor_hora(valor_sugerido: float | None = None) -> float:
         return round(valor, 2)
 
 
+_MOEDA_STRIP = str.maketrans("", "", "R$ ")
+_TT_COMMA_DOT = str.maketrans({",": "."})
+_TT_MILHAR_BR = str.maketrans({".": None, ",": "."})
+
+
 def _parse_float_moeda(valor: str | None) -> float:
     if not valor:
         return 0.0
-    s = str(valor).strip()
+    # caminho comum: número simples com ponto, direto do CSV
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        pass
+    s = str(valor).strip().translate(_MOEDA_STRIP)
     if not s:
         return 0.0
-    s = s.replace("R$", "").strip()
     if "," in s and "." in s:
-        s = s.replace(".", "").replace(",", ".")
+        s = s.translate(_TT_MILHAR_BR)
     else:
-        s = s.replace(",", ".")
+        s = s.translate(_TT_COMMA_DOT)
     try:
         return float(s)
     except ValueError:
@@ -88,25 +101,51 @@ def _fmt_2(v: float) -> str:
     return f"{v:.2f}"
 
 
+# troca "," <-> "." numa passada só: 1,234.56 -> 1.234,56
+_TT_REAIS = str.maketrans(",.", ".,")
+
+
 def formatar_reais(valor: float) -> str:
-    texto = f"{valor:,.2f}"
-    texto = texto.replace(",", "_").replace(".", ",").replace("_", ".")
+    texto = f"{valor:,.2f}".translate(_TT_REAIS)
     return f"R$ {texto}"
 
 
+STATUS_NAO = 0
+STATUS_SIM = 1
+STATUS_PARCIAL = 2
+
+_STATUS_CODIGOS = {"": STATUS_NAO, "não": STATUS_NAO, "nao": STATUS_NAO, "sim": STATUS_SIM, "parcial": STATUS_PARCIAL}
+_STATUS_CACHE: dict[str, int] = {}
+
+
+def _codigo_status(bruto: str | None) -> int:
+    # poucos valores distintos ("Sim", "Não", "Parcial"): normaliza uma vez só por texto bruto
+    bruto = bruto or ""
+    try:
+        return _STATUS_CACHE[bruto]
+    except KeyError:
+        codigo = _STATUS_CACHE[bruto] = _STATUS_CODIGOS.get(bruto.strip().lower(), STATUS_NAO)
+        return codigo
+
+
 def ler_valor_hora_no_arquivo(filename: str) -> float | None:
     if not os.path.isfile(filename):
         return None
     with open(filename, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        if not reader.fieldnames or "valor_hora" not in reader.fieldnames:
+        reader = csv.reader(csvfile)
+        cabecalho = next(reader, None)
+        if not cabecalho:
+            return None
+        try:
+            idx = cabecalho.index("valor_hora")
+        except ValueError:
             return None
         for row in reader:
-            bruto = row.get("valor_hora")
+            bruto = row[idx] if len(row) > idx else ""
             if not bruto:
                 continue
             try:
-                return float(str(bruto).replace(",", "."))
+                return float(bruto.replace(",", "."))
             except ValueError:
                 continue
     return None
@@ -117,55 +156,60 @@ def sincronizar_layout_csv(filename: str, valor_hora_padrao: float | None = None
         return
 
     with open(filename, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        registros = list(reader)
-        cabecalho = reader.fieldnames or []
-
-    precisa_coluna = cabecalho != FIELDNAMES
-    precisa_completar_valor_hora = any(not str(reg.get("valor_hora", "")).strip() for reg in registros)
-
-    if not precisa_coluna and not (precisa_completar_valor_hora and valor_hora_padrao is not None):
-        return
-
-    with open(filename, "w", newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile)
+        cabecalho = next(reader, None) or []
+        if tuple(cabecalho) == _FIELDNAMES_TUPLE:
+            # layout em dia: só reescreve se houver valor_hora vazio para completar
+            if valor_hora_padrao is None:
+                return
+            idx = cabecalho.index("valor_hora")
+            if not any(len(row) > idx and not row[idx].strip() for row in reader):
+                return
+
+        csvfile.seek(0)
+        registros = list(csv.DictReader(csvfile))
+
+    saida = []
+    for row in registros:
+        valor_hora_atual = str(row.get("valor_hora", "") or "").strip()
+        if not valor_hora_atual and valor_hora_padrao is not None:
+            valor_hora_atual = f"{valor_hora_padrao:.2f}"
+
+        valor = row.get("valor", "")
+        pago = row.get("pago", "")
+
+        valor_pago = row.get("valor_pago", "")
+        valor_pendente = row.get("valor_pendente", "")
+        data_pag = row.get("data_pagamento", "")
+        desc_pag = row.get("descricao_pagamento", "")
+
+        if _codigo_status(pago) == STATUS_PARCIAL and not str(valor_pendente).strip():
+            total = _parse_float_moeda(valor)
+            ja = _parse_float_moeda(valor_pago)
+            pend = max(total - ja, 0.0)
+            valor_pendente = _fmt_2(pend) if pend > 0 else "0.00"
+
+        saida.append(
+            {
+                "n": row.get("n", ""),
+                "tempo_total": row.get("tempo_total", ""),
+                "atividade": row.get("atividade", ""),
+                "data_inicio": row.get("data_inicio", ""),
+                "data_fim": row.get("data_fim", ""),
+                "valor_hora": valor_hora_atual,
+                "valor": valor,
+                "pago": pago,
+                "valor_pago": valor_pago,
+                "valor_pendente": valor_pendente,
+                "data_pagamento": data_pag,
+                "descricao_pagamento": desc_pag,
+            }
+        )
+
+    with open(filename, "w", newline="", encoding="utf-8", buffering=TAMANHO_BUFFER_ESCRITA) as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
         writer.writeheader()
-
-        for row in registros:
-            valor_hora_atual = str(row.get("valor_hora", "") or "").strip()
-            if not valor_hora_atual and valor_hora_padrao is not None:
-                valor_hora_atual = f"{valor_hora_padrao:.2f}"
-
-            valor = row.get("valor", "")
-            pago = row.get("pago", "")
-
-            valor_pago = row.get("valor_pago", "")
-            valor_pendente = row.get("valor_pendente", "")
-            data_pag = row.get("data_pagamento", "")
-            desc_pag = row.get("descricao_pagamento", "")
-
-            if str(pago).strip().lower() == "parcial" and not str(valor_pendente).strip():
-                total = _parse_float_moeda(valor)
-                ja = _parse_float_moeda(valor_pago)
-                pend = max(total - ja, 0.0)
-                valor_pendente = _fmt_2(pend) if pend > 0 else "0.00"
-
-            writer.writerow(
-                {
-                    "n": row.get("n", ""),
-                    "tempo_total": row.get("tempo_total", ""),
-                    "atividade": row.get("atividade", ""),
-                    "data_inicio": row.get("data_inicio", ""),
-                    "data_fim": row.get("data_fim", ""),
-                    "valor_hora": valor_hora_atual,
-                    "valor": valor,
-                    "pago": pago,
-                    "valor_pago": valor_pago,
-                    "valor_pendente": valor_pendente,
-                    "data_pagamento": data_pag,
-                    "descricao_pagamento": desc_pag,
-                }
-            )
+        writer.writerows(saida)
 
 
 def obter_valor_hora_projeto(filename: str) -> float:
@@ -205,34 +249,42 @@ def criar_novo_projeto() -> tuple[str, float]:
 
 
 def selecionar_ou_criar_projeto() -> tuple[str, float]:
+    # lista uma vez só: entradas inválidas não mudam o diretório
+    projetos = listar_projetos()
+    if not projetos:
+        print("\nNenhum projeto encontrado. Vamos criar o primeiro agora.")
+        return criar_novo_projeto()
+
     while True:
-        projetos = listar_projetos()
-        if projetos:
-            print("\n=== Projetos disponíveis ===")
-            for idx, nome in enumerate(projetos, start=1):
-                print(f"{idx}. {nome}")
-            print(f"{len(projetos) + 1}. Criar novo projeto")
-
-            escolha = input("Selecione uma opção: ").strip()
-            if not escolha.isdigit():
-                print("Informe o número da opção.")
-                continue
+        print("\n=== Projetos disponíveis ===")
+        for idx, nome in enumerate(projetos, start=1):
+            print(f"{idx}. {nome}")
+        print(f"{len(projetos) + 1}. Criar novo projeto")
+
+        escolha = input("Selecione uma opção: ").strip()
+        if not escolha.isdigit():
+            print("Informe o número da opção.")
+            continue
 
-            indice = int(escolha)
-            if 1 <= indice <= len(projetos):
-                arquivo = projetos[indice - 1]
-                caminho = os.path.join(BASE_DIR, arquivo)
-                print(f"\nProjeto selecionado: {arquivo}")
-                valor_hora = obter_valor_hora_projeto(caminho)
-                return caminho, valor_hora
-            if indice == len(projetos) + 1:
-                return criar_novo_projeto()
-
-            print("Opção inválida. Tente novamente.")
-        else:
-            print("\nNenhum projeto encontrado. Vamos criar o primeiro agora.")
+        indice = int(escolha)
+        if 1 <= indice <= len(projetos):
+            arquivo = projetos[indice - 1]
+            caminho = os.path.join(BASE_DIR, arquivo)
+            print(f"\nProjeto selecionado: {arquivo}")
+            valor_hora = obter_valor_hora_projeto(caminho)
+            return caminho, valor_hora
+        if indice == len(projetos) + 1:
             return criar_novo_projeto()
 
+        print("Opção inválida. Tente novamente.")
+
+
+def _ler_cabecalho(filename: str) -> tuple[str, ...]:
+    if not os.path.isfile(filename):
+        return ()
+    with open(filename, newline="", encoding="utf-8") as csvfile:
+        return tuple(next(csv.reader(csvfile), ()))
+
 
 def _ler_registros(filename: str) -> list[dict]:
     if not os.path.isfile(filename):
@@ -242,70 +294,112 @@ def _ler_registros(filename: str) -> list[dict]:
         return list(reader)
 
 
+def _linha_para_escrita(row: dict) -> dict:
+    saida = {k: row.get(k, "") for k in FIELDNAMES}
+    # históricos acumulados em lista durante a sessão: junta uma vez só, na gravação
+    datas = row.get("_datas_pagamento")
+    if datas is not None:
+        saida["data_pagamento"] = " ; ".join(datas)
+    historico = row.get("_historico_pagamento")
+    if historico is not None:
+        saida["descricao_pagamento"] = " || ".join(historico)
+    return saida
+
+
 def _escrever_registros_atomic(filename: str, registros: list[dict]):
     tmp = f"{filename}.tmp"
-    with open(tmp, "w", newline="", encoding="utf-8") as csvfile:
+    with open(tmp, "w", newline="", encoding="utf-8", buffering=TAMANHO_BUFFER_ESCRITA) as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
         writer.writeheader()
-        for row in registros:
-            writer.writerow({k: row.get(k, "") for k in FIELDNAMES})
+        writer.writerows(_linha_para_escrita(row) for row in registros)
     os.replace(tmp, filename)
 
 
+def _iter_rows_indexed(filename: str):
+    """Percorre o CSV com csv.reader, devolvendo (col, row) com col = nome -> índice."""
+    if not os.path.isfile(filename):
+        return
+    with open(filename, newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile)
+        cabecalho = next(reader, None)
+        if not cabecalho:
+            return
+        col = {nome: i for i, nome in enumerate(cabecalho)}
+        largura = len(cabecalho)
+        faltando = _FIELDSET.difference(col)
+        if faltando:
+            # colunas ausentes apontam para uma célula vazia extra no fim da linha
+            for nome in faltando:
+                col[nome] = largura
+            largura += 1
+        for row in reader:
+            if not row:
+                continue  # linha em branco (DictReader também ignorava)
+            if len(row) < largura:
+                row.extend([""] * (largura - len(row)))
+            yield col, row
+
+
 def _saldo_pendente(registros: list[dict]) -> float:
     saldo = 0.0
     for r in registros:
-        status = str(r.get("pago", "")).strip().lower()
-        if status == "sim":
+        status = _codigo_status(r.get("pago"))
+        if status == STATUS_SIM:
             continue
-        if status == "parcial":
+        if status == STATUS_PARCIAL:
             saldo += _parse_float_moeda(r.get("valor_pendente"))
         else:
             saldo += _parse_float_moeda(r.get("valor"))
     return round(saldo, 2)
 
 
+def _resumo_pendencias(filename: str) -> tuple[float, dict | None]:
+    """Saldo pendente e primeiro item não pago, numa única passada pelo CSV."""
+    saldo = 0.0
+    proximo = None
+    for col, row in _iter_rows_indexed(filename):
+        status = _codigo_status(row[col["pago"]])
+        if status == STATUS_SIM:
+            continue
+        # próximo a quitar precisa de um id (n); linhas sem id não são apontamentos
+        if proximo is None and row[col["n"]].strip():
+            proximo = {nome: row[i] for nome, i in col.items()}
+        if status == STATUS_PARCIAL:
+            saldo += _parse_float_moeda(row[col["valor_pendente"]])
+        else:
+            saldo += _parse_float_moeda(row[col["valor"]])
+    return round(saldo, 2), proximo
+
+
 def _append_historico(row: dict, data_str: str, desc: str, valor_aplicado: float):
     linha = f"{data_str} | {desc} | {_fmt_2(valor_aplicado)}"
-    atual_d = str(row.get("data_pagamento", "") or "").strip()
-    atual_t = str(row.get("descricao_pagamento", "") or "").strip()
 
     # data_pagamento: lista de datas
-    if atual_d:
-        row["data_pagamento"] = atual_d + " ; " + data_str
-    else:
-        row["data_pagamento"] = data_str
+    datas = row.get("_datas_pagamento")
+    if datas is None:
+        atual_d = str(row.get("data_pagamento", "") or "").strip()
+        datas = row["_datas_pagamento"] = [atual_d] if atual_d else []
+    datas.append(data_str)
 
     # descricao_pagamento: histórico textual com valor aplicado
-    if atual_t:
-        row["descricao_pagamento"] = atual_t + " || " + linha
-    else:
-        row["descricao_pagamento"] = linha
-
+    historico = row.get("_historico_pagamento")
+    if historico is None:
+        atual_t = str(row.get("descricao_pagamento", "") or "").strip()
+        historico = row["_historico_pagamento"] = [atual_t] if atual_t else []
+    historico.append(linha)
 
-def consultar_saldo(filename: str):
-    sincronizar_layout_csv(filename, ler_valor_hora_no_arquivo(filename) or None)
-    registros = _ler_registros(filename)
-    saldo = _saldo_pendente(registros)
 
+def _imprimir_saldo(filename: str, saldo: float, proximo: dict | None):
     print("\nPendências:")
     print("-" * 60)
     print(f"Projeto        : {os.path.basename(filename)}")
     print(f"Saldo pendente : {formatar_reais(saldo)}")
 
-    proximo = None
-    for r in registros:
-        st = str(r.get("pago", "")).strip().lower()
-        if st == "sim":
-            continue
-        proximo = r
-        break
-
     if proximo:
         st = str(proximo.get("pago", "")).strip()
         v = _parse_float_moeda(proximo.get("valor"))
         pend = _parse_float_moeda(proximo.get("valor_pendente"))
-        alvo = pend if st.lower() == "parcial" else v
+        alvo = pend if _codigo_status(st) == STATUS_PARCIAL else v
         print("-" * 60)
         print("Próximo a quitar:")
         print(f"ID (n)     : {proximo.get('n','')}")
@@ -315,6 +409,26 @@ def consultar_saldo(filename: str):
     print("-" * 60)
 
 
+def consultar_saldo(filename: str):
+    sincronizar_layout_csv(filename, ler_valor_hora_no_arquivo(filename) or None)
+    saldo, proximo = _resumo_pendencias(filename)
+    _imprimir_saldo(filename, saldo, proximo)
+
+
+def consultar_saldo_registros(registros: list[dict], filename: str):
+    """Mesma saída de consultar_saldo, a partir de registros já carregados."""
+    proximo = None
+    for r in registros:
+        if _codigo_status(r.get("pago")) == STATUS_SIM:
+            continue
+        if not str(r.get("n") or "").strip():
+            continue
+        proximo = r
+        break
+
+    _imprimir_saldo(filename, _saldo_pendente(registros), proximo)
+
+
 def solicitar_valor_pagamento() -> float:
     while True:
         bruto = input("Valor do pagamento (R$): ").strip()
@@ -332,17 +446,18 @@ def solicitar_data_pagamento() -> str:
         if not s:
             return agora
         # aceita YYYY-MM-DD ou YYYY-MM-DD HH:MM[:SS]
-        try:
-            if len(s) == 10:
-                datetime.strptime(s, "%Y-%m-%d")
-                return s + " 00:00:00"
-            if len(s) == 16:
-                datetime.strptime(s, "%Y-%m-%d %H:%M")
-                return s + ":00"
-            datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
-            return s
-        except ValueError:
-            print("Formato inválido. Use: YYYY-MM-DD ou YYYY-MM-DD HH:MM[:SS].")
+        if DATA_PAGAMENTO_REGEX.fullmatch(s):
+            try:
+                datetime.fromisoformat(s)
+            except ValueError:
+                pass
+            else:
+                if len(s) == 10:
+                    return s + " 00:00:00"
+                if len(s) == 16:
+                    return s + ":00"
+                return s
+        print("Formato inválido. Use: YYYY-MM-DD ou YYYY-MM-DD HH:MM[:SS].")
 
 
 def solicitar_descricao_pagamento() -> str:
@@ -354,7 +469,9 @@ def solicitar_descricao_pagamento() -> str:
 
 
 def efetivar_pagamento(filename: str):
-    sincronizar_layout_csv(filename, ler_valor_hora_no_arquivo(filename) or None)
+    # o layout já é sincronizado ao selecionar o projeto; só reescreve se o cabeçalho mudou
+    if _ler_cabecalho(filename) != _FIELDNAMES_TUPLE:
+        sincronizar_layout_csv(filename, ler_valor_hora_no_arquivo(filename) or None)
     registros = _ler_registros(filename)
 
     saldo_antes = _saldo_pendente(registros)
@@ -385,25 +502,27 @@ def efetivar_pagamento(filename: str):
     parcial_info = None
 
     for r in registros:
-        st_raw = str(r.get("pago", "") or "").strip()
-        st = st_raw.lower()
+        st = _codigo_status(r.get("pago"))
 
-        if st == "sim":
+        if st == STATUS_SIM:
             continue
 
         total = _parse_float_moeda(r.get("valor"))
-        ja_pago = _parse_float_moeda(r.get("valor_pago"))
-        pendente = _parse_float_moeda(r.get("valor_pendente"))
 
-        if st == "parcial":
-            alvo = pendente if pendente > 0 else max(total - ja_pago, 0.0)
+        # valor_pago/valor_pendente só importam para itens parciais (ou alvo zerado)
+        if st == STATUS_PARCIAL:
+            pendente = _parse_float_moeda(r.get("valor_pendente"))
+            if pendente > 0:
+                alvo = pendente
+            else:
+                alvo = max(total - _parse_float_moeda(r.get("valor_pago")), 0.0)
         else:
             alvo = total
 
         alvo = round(alvo, 2)
         if alvo <= 0:
             r["pago"] = "Sim"
-            r["valor_pago"] = _fmt_2(total if total > 0 else ja_pago)
+            r["valor_pago"] = _fmt_2(total if total > 0 else _parse_float_moeda(r.get("valor_pago")))
             r["valor_pendente"] = "0.00"
             continue
 
@@ -423,7 +542,7 @@ def efetivar_pagamento(filename: str):
             pago_agora = round(pagamento_restante, 2)
             novo_pendente = round(alvo - pago_agora, 2)
 
-            if st == "parcial":
+            if st == STATUS_PARCIAL:
                 novo_valor_pago = round(total - novo_pendente, 2)
             else:
                 novo_valor_pago = round(pago_agora, 2)
@@ -453,7 +572,7 @@ def efetivar_pagamento(filename: str):
 
     _escrever_registros_atomic(filename, registros)
     print("\n✅ Pagamento registrado.")
-    consultar_saldo(filename)
+    consultar_saldo_registros(registros, filename)
 
 
 def menu_principal(filename: str):